@@ -1,41 +1,78 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, TypeAdapter
 from typing import List, Optional, Literal
 import uuid
-from datetime import datetime, timezone, timedelta
+import re
+import string
+from datetime import datetime, timezone
 import jwt
+import time
+import hashlib
+from cachetools import TTLCache
 from emergentintegrations.llm.chat import LlmChat, UserMessage
-import json
-from passlib.context import CryptContext
+import orjson
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    tz_aware=True,
+    maxPoolSize=200,
+    minPoolSize=20,
+    compressors="zstd,zlib",
+    serverSelectionTimeoutMS=2000,
+    retryWrites=True
+)
 db = client[os.environ['DB_NAME']]
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'travel_planner_secret_key')
 JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
 JWT_EXPIRATION_HOURS = int(os.environ.get('JWT_EXPIRATION_HOURS', 720))
+_JWT_EXP_SECONDS = JWT_EXPIRATION_HOURS * 3600
+_jwt = jwt.PyJWT()
+_jwt_key = JWT_SECRET.encode()
+
+EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+ITINERARY_MODEL = ("openai", "gpt-5.2")
+ITINERARY_SYSTEM_MESSAGE = "You are an expert travel planner. Generate detailed, realistic day-wise travel itineraries based on user preferences."
 
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# bcrypt is CPU-bound; keep it off the event loop.
+_bcrypt_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Authenticated user lookups keyed by a digest of the bearer token.
+_user_cache = TTLCache(maxsize=10000, ttl=30)
+# Recently generated itinerary responses keyed by (user_id, trip_id).
+_itinerary_cache = TTLCache(maxsize=1000, ttl=300)
+# In-progress generation tasks, so concurrent requests for one trip share a result.
+_inflight_itineraries: dict = {}
+
+# Strips an optional ```json ... ``` fence around LLM output.
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
 
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     email: str
     name: str
     password_hash: str
@@ -52,7 +89,7 @@ class UserLogin(BaseModel):
 
 class TripCriteria(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     user_id: str
     location: str
     time_of_arrival: str
@@ -65,6 +102,7 @@ class TripCriteria(BaseModel):
     trip_vibe: Literal["relaxing", "adventurous", "party", "cultural", "nature", "mix"]
     hectic_level: Literal["very_relaxed", "moderately_relaxed", "moderate", "medium_to_high", "very_hectic"]
     places_preference: Literal["mainstream", "hidden_gems", "balanced"]
+    itinerary_id: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class TripCriteriaCreate(BaseModel):
@@ -82,33 +120,50 @@ class TripCriteriaCreate(BaseModel):
 
 class Itinerary(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     trip_id: str
     user_id: str
     itinerary_data: dict
+    criteria_key: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class TokenResponse(BaseModel):
     token: str
     user: dict
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+trip_list_adapter = TypeAdapter(List[TripCriteria])
+
+ITINERARY_CRITERIA_FIELDS = ('user_id', *TripCriteriaCreate.model_fields)
+
+def itinerary_criteria_key(trip: dict) -> str:
+    criteria = {field: trip[field] for field in ITINERARY_CRITERIA_FIELDS}
+    return hashlib.blake2b(orjson.dumps(criteria, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def _bcrypt_hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+
+def _bcrypt_verify(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_pool, _bcrypt_hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_pool, _bcrypt_verify, plain_password, hashed_password)
 
 def create_jwt_token(user_data: dict) -> str:
     payload = {
         'user_id': user_data['id'],
         'email': user_data['email'],
-        'exp': datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+        'exp': int(time.time()) + _JWT_EXP_SECONDS
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return _jwt.encode(payload, _jwt_key, algorithm=JWT_ALGORITHM)
 
 def decode_jwt_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = _jwt.decode(token, _jwt_key, algorithms=[JWT_ALGORITHM])
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
@@ -117,19 +172,118 @@ def decode_jwt_token(token: str) -> dict:
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = _user_cache.get(key)
+    if cached:
+        user, exp = cached
+        if exp > time.time():
+            return user
+        _user_cache.pop(key, None)
+
     payload = decode_jwt_token(token)
+    if payload['exp'] <= time.time():
+        raise HTTPException(status_code=401, detail="Token has expired")
     user = await db.users.find_one({'id': payload['user_id']}, {'_id': 0})
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    _user_cache[key] = (user, payload['exp'])
     return user
 
+def _itinerary_chat(trip_id: str) -> LlmChat:
+    # LlmChat carries per-session history, so it is created per trip; the
+    # underlying provider client already pools its HTTP connections.
+    chat = LlmChat(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=f"itinerary_{trip_id}",
+        system_message=ITINERARY_SYSTEM_MESSAGE
+    )
+    chat.with_model(*ITINERARY_MODEL)
+    return chat
+
+_ITINERARY_PROMPT = string.Template("""
+Create a detailed $number_of_days-day travel itinerary for $location with the following criteria:
+
+- Arrival: $time_of_arrival
+- Departure: $time_of_departure
+- Staying at: $location_of_stay
+- Check-in: $check_in_datetime
+- Check-out: $check_out_datetime
+- Trip type: $trip_type
+- Trip vibe: $trip_vibe
+- Hectic level: $hectic_level
+- Places preference: $places_preference
+
+Generate a JSON response with the following structure:
+{
+  "days": [
+    {
+      "day": 1,
+      "date": "Day 1",
+      "activities": [
+        {
+          "time": "Morning (8:00 AM - 12:00 PM)",
+          "title": "Activity title",
+          "description": "Detailed description",
+          "travel_time": "15 minutes from hotel",
+          "tips": "Helpful tips"
+        }
+      ]
+    }
+  ]
+}
+
+Ensure the itinerary:
+1. Respects arrival and departure times
+2. Matches the hectic level (more rest for relaxed, packed for hectic)
+3. Aligns with trip type (family-friendly, adventurous for friends, romantic for couples, flexible for solo)
+4. Reflects the vibe preference
+5. Includes realistic travel times
+6. Has food recommendations
+7. Considers check-in/check-out times
+
+Respond ONLY with valid JSON, no markdown or extra text.
+""")
+
+def _itinerary_prompt(trip: dict) -> str:
+    return _ITINERARY_PROMPT.substitute(trip)
+
+def _parse_itinerary(response: str) -> dict:
+    try:
+        itinerary_data = orjson.loads(response)
+    except orjson.JSONDecodeError:
+        match = _FENCE_RE.match(response)
+        cleaned_response = match.group(1) if match else response.strip()
+        itinerary_data = orjson.loads(cleaned_response)
+    
+    if not isinstance(itinerary_data, dict):
+        raise ValueError("Itinerary response is not a JSON object")
+    return itinerary_data
+
+async def _request_itinerary(trip_id: str, trip: dict) -> dict:
+    chat = _itinerary_chat(trip_id)
+    response = await chat.send_message(UserMessage(text=_itinerary_prompt(trip)))
+    return _parse_itinerary(response)
+
+async def _save_itinerary(itinerary: Itinerary):
+    # Insert first so the trip never points at an itinerary that wasn't written.
+    await db.itineraries.insert_one(itinerary.model_dump())
+    await db.trips.update_one(
+        {'id': itinerary.trip_id, 'user_id': itinerary.user_id},
+        {'$set': {'itinerary_id': itinerary.id}}
+    )
+
+def etag_response(request: Request, content, cache_control: str = 'private, max-age=60') -> Response:
+    body = orjson.dumps(content)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in (tag.strip() for tag in if_none_match.split(',')):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @api_router.post("/auth/register", response_model=TokenResponse)
 async def register(user_data: UserRegister):
-    existing_user = await db.users.find_one({'email': user_data.email}, {'_id': 0})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    password_hash = hash_password(user_data.password)
+    password_hash = await hash_password(user_data.password)
     user_obj = User(
         email=user_data.email,
         name=user_data.name,
@@ -137,9 +291,11 @@ async def register(user_data: UserRegister):
     )
     
     user_dict = user_obj.model_dump()
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     token = create_jwt_token({
         'id': user_obj.id,
@@ -161,7 +317,7 @@ async def login(credentials: UserLogin):
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if not verify_password(credentials.password, user['password_hash']):
+    if not await verify_password(credentials.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     token = create_jwt_token({
@@ -188,129 +344,111 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 
 @api_router.post("/trips", response_model=TripCriteria)
 async def create_trip(trip_data: TripCriteriaCreate, current_user: dict = Depends(get_current_user)):
-    trip_dict = trip_data.model_dump()
-    trip_obj = TripCriteria(**trip_dict, user_id=current_user['id'])
+    # trip_data is already validated; skip re-validating the same fields.
+    trip_obj = TripCriteria.model_construct(**trip_data.model_dump(), user_id=current_user['id'])
     
     doc = trip_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     
     await db.trips.insert_one(doc)
     return trip_obj
 
 @api_router.get("/trips", response_model=List[TripCriteria])
-async def get_trips(current_user: dict = Depends(get_current_user)):
-    trips = await db.trips.find({'user_id': current_user['id']}, {'_id': 0}).to_list(100)
-    for trip in trips:
-        if isinstance(trip['created_at'], str):
-            trip['created_at'] = datetime.fromisoformat(trip['created_at'])
-    return trips
+async def get_trips(request: Request, current_user: dict = Depends(get_current_user)):
+    cursor = db.trips.find({'user_id': current_user['id']}, {'_id': 0}).sort('created_at', -1).batch_size(100)
+    trips = await cursor.to_list(100)
+    # Serialize through the model so the body matches response_model.
+    content = trip_list_adapter.dump_python(trip_list_adapter.validate_python(trips), mode='json')
+    # The list changes on every POST /trips, so always revalidate against the ETag.
+    return etag_response(request, content, cache_control='private, no-cache')
+
+@api_router.get("/trips/{trip_id}", response_model=TripCriteria)
+async def get_trip(trip_id: str, current_user: dict = Depends(get_current_user)):
+    trip = await db.trips.find_one({'id': trip_id, 'user_id': current_user['id']}, {'_id': 0})
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return trip
 
 @api_router.post("/trips/{trip_id}/generate-itinerary")
 async def generate_itinerary(trip_id: str, current_user: dict = Depends(get_current_user)):
+    cache_key = (current_user['id'], trip_id)
+    cached = _itinerary_cache.get(cache_key)
+    if cached:
+        return cached
+
+    task = _inflight_itineraries.get(cache_key)
+    if task is None:
+        # Own task, so a disconnecting caller can't cancel it for the others.
+        task = asyncio.create_task(_generate_itinerary(trip_id, current_user))
+        _inflight_itineraries[cache_key] = task
+        task.add_done_callback(lambda done: _finish_inflight(cache_key, done))
+    return await asyncio.shield(task)
+
+def _finish_inflight(cache_key: tuple, task: asyncio.Task):
+    if _inflight_itineraries.get(cache_key) is task:
+        del _inflight_itineraries[cache_key]
+    if not task.cancelled():
+        # Mark retrieved so a failure nobody awaited isn't logged by asyncio.
+        task.exception()
+
+async def _generate_itinerary(trip_id: str, current_user: dict) -> dict:
+    cache_key = (current_user['id'], trip_id)
     trip = await db.trips.find_one({'id': trip_id, 'user_id': current_user['id']}, {'_id': 0})
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
+
+    criteria_key = itinerary_criteria_key(trip)
+    stored = await db.itineraries.find_one({'criteria_key': criteria_key, 'trip_id': trip_id}, {'_id': 0})
+    if stored:
+        result = {
+            'id': stored['id'],
+            'trip_id': trip_id,
+            'itinerary': stored['itinerary_data']
+        }
+        _itinerary_cache[cache_key] = result
+        return result
     
     try:
-        chat = LlmChat(
-            api_key=os.environ.get('EMERGENT_LLM_KEY'),
-            session_id=f"itinerary_{trip_id}",
-            system_message="You are an expert travel planner. Generate detailed, realistic day-wise travel itineraries based on user preferences."
-        )
-        chat.with_model("openai", "gpt-5.2")
-        
-        prompt = f"""
-Create a detailed {trip['number_of_days']}-day travel itinerary for {trip['location']} with the following criteria:
-
-- Arrival: {trip['time_of_arrival']}
-- Departure: {trip['time_of_departure']}
-- Staying at: {trip['location_of_stay']}
-- Check-in: {trip['check_in_datetime']}
-- Check-out: {trip['check_out_datetime']}
-- Trip type: {trip['trip_type']}
-- Trip vibe: {trip['trip_vibe']}
-- Hectic level: {trip['hectic_level']}
-- Places preference: {trip['places_preference']}
-
-Generate a JSON response with the following structure:
-{{
-  "days": [
-    {{
-      "day": 1,
-      "date": "Day 1",
-      "activities": [
-        {{
-          "time": "Morning (8:00 AM - 12:00 PM)",
-          "title": "Activity title",
-          "description": "Detailed description",
-          "travel_time": "15 minutes from hotel",
-          "tips": "Helpful tips"
-        }}
-      ]
-    }}
-  ]
-}}
-
-Ensure the itinerary:
-1. Respects arrival and departure times
-2. Matches the hectic level (more rest for relaxed, packed for hectic)
-3. Aligns with trip type (family-friendly, adventurous for friends, romantic for couples, flexible for solo)
-4. Reflects the vibe preference
-5. Includes realistic travel times
-6. Has food recommendations
-7. Considers check-in/check-out times
-
-Respond ONLY with valid JSON, no markdown or extra text.
-"""
-        
-        user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
-        
-        try:
-            itinerary_data = json.loads(response)
-        except json.JSONDecodeError:
-            cleaned_response = response.strip()
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response[7:]
-            if cleaned_response.startswith('```'):
-                cleaned_response = cleaned_response[3:]
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3]
-            itinerary_data = json.loads(cleaned_response.strip())
+        # Same criteria as another of this user's trips: reuse its itinerary.
+        sibling = await db.itineraries.find_one({'criteria_key': criteria_key}, {'_id': 0, 'itinerary_data': 1})
+        if sibling:
+            itinerary_data = sibling['itinerary_data']
+        else:
+            itinerary_data = await _request_itinerary(trip_id, trip)
         
-        itinerary_obj = Itinerary(
+        itinerary_obj = Itinerary.model_construct(
             trip_id=trip_id,
             user_id=current_user['id'],
-            itinerary_data=itinerary_data
+            itinerary_data=itinerary_data,
+            criteria_key=criteria_key
         )
         
-        doc = itinerary_obj.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
+        await _save_itinerary(itinerary_obj)
         
-        await db.itineraries.insert_one(doc)
-        
-        return {
+        result = {
             'id': itinerary_obj.id,
             'trip_id': trip_id,
             'itinerary': itinerary_data
         }
+        _itinerary_cache[cache_key] = result
+        return result
         
     except Exception as e:
         logging.error(f"Error generating itinerary: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate itinerary: {str(e)}")
 
 @api_router.get("/trips/{trip_id}/itinerary")
-async def get_itinerary(trip_id: str, current_user: dict = Depends(get_current_user)):
+async def get_itinerary(trip_id: str, request: Request, current_user: dict = Depends(get_current_user)):
     itinerary = await db.itineraries.find_one(
         {'trip_id': trip_id, 'user_id': current_user['id']},
-        {'_id': 0}
+        {'_id': 0, 'criteria_key': 0}
     )
     if not itinerary:
         raise HTTPException(status_code=404, detail="Itinerary not found")
-    return itinerary
+    return etag_response(request, itinerary)
 
 app.include_router(api_router)
 
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 app.add_middleware(SessionMiddleware, secret_key=JWT_SECRET)
 app.add_middleware(
     CORSMiddleware,
@@ -326,6 +464,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await db.users.create_index("email", unique=True)
+    await db.users.create_index("id", unique=True)
+    await db.trips.create_index([("user_id", 1), ("id", 1)])
+    await db.trips.create_index([("user_id", 1), ("created_at", -1)])
+    await db.itineraries.create_index([("trip_id", 1), ("user_id", 1)])
+    await db.itineraries.create_index([("criteria_key", 1), ("trip_id", 1)])
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    _bcrypt_pool.shutdown(wait=False)
\ No newline at end of file
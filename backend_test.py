@@ -1,12 +1,16 @@
-import requests
+import asyncio
+import importlib.util
 import sys
 import json
 from datetime import datetime, timedelta
 
+import httpx
+
 class TravelPlannerAPITester:
     def __init__(self, base_url="https://itinera-2.preview.emergentagent.com"):
         self.base_url = base_url
         self.api_url = f"{base_url}/api"
+        self.client = None
         self.token = None
         self.user_data = None
         self.tests_run = 0
@@ -16,63 +20,67 @@ class TravelPlannerAPITester:
         self.test_user_name = "Test User"
         self.trip_id = None
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None):
+    async def run_test(self, name, method, endpoint, expected_status, data=None, headers=None, authenticated=True):
         """Run a single API test"""
         url = f"{self.api_url}/{endpoint}"
         test_headers = {'Content-Type': 'application/json'}
         
-        if self.token:
+        if self.token and authenticated:
             test_headers['Authorization'] = f'Bearer {self.token}'
         
         if headers:
             test_headers.update(headers)
 
         self.tests_run += 1
-        print(f"\n🔍 Testing {name}...")
-        print(f"   URL: {url}")
-        print(f"   Method: {method}")
+        # Tests run concurrently, so buffer output and print it in one block.
+        log = [
+            f"\n🔍 Testing {name}...",
+            f"   URL: {url}",
+            f"   Method: {method}",
+        ]
         
         try:
             # Use longer timeout for itinerary generation
             timeout = 120 if 'generate-itinerary' in endpoint else 30
             
-            if method == 'GET':
-                response = requests.get(url, headers=test_headers, timeout=timeout)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=test_headers, timeout=timeout)
-            elif method == 'PUT':
-                response = requests.put(url, json=data, headers=test_headers, timeout=timeout)
-            elif method == 'DELETE':
-                response = requests.delete(url, headers=test_headers, timeout=timeout)
+            response = await self.client.request(
+                method,
+                url,
+                json=data if method in ('POST', 'PUT') else None,
+                headers=test_headers,
+                timeout=timeout
+            )
 
-            print(f"   Status: {response.status_code}")
+            log.append(f"   Status: {response.status_code}")
             
             success = response.status_code == expected_status
             if success:
                 self.tests_passed += 1
-                print(f"✅ Passed - Status: {response.status_code}")
+                log.append(f"✅ Passed - Status: {response.status_code}")
                 try:
                     response_data = response.json()
-                    print(f"   Response: {json.dumps(response_data, indent=2)[:200]}...")
+                    log.append(f"   Response: {json.dumps(response_data, indent=2)[:200]}...")
                     return True, response_data
                 except:
                     return True, {}
             else:
-                print(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
+                log.append(f"❌ Failed - Expected {expected_status}, got {response.status_code}")
                 try:
                     error_data = response.json()
-                    print(f"   Error: {error_data}")
+                    log.append(f"   Error: {error_data}")
                 except:
-                    print(f"   Error: {response.text}")
+                    log.append(f"   Error: {response.text}")
                 return False, {}
 
         except Exception as e:
-            print(f"❌ Failed - Error: {str(e)}")
+            log.append(f"❌ Failed - Error: {str(e)}")
             return False, {}
+        finally:
+            print("\n".join(log))
 
-    def test_user_registration(self):
+    async def test_user_registration(self):
         """Test user registration"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "User Registration",
             "POST",
             "auth/register",
@@ -90,9 +98,9 @@ class TravelPlannerAPITester:
             return True
         return False
 
-    def test_user_login(self):
+    async def test_user_login(self):
         """Test user login"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "User Login",
             "POST",
             "auth/login",
@@ -109,9 +117,9 @@ class TravelPlannerAPITester:
             return True
         return False
 
-    def test_get_current_user(self):
+    async def test_get_current_user(self):
         """Test get current user endpoint"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get Current User",
             "GET",
             "auth/me",
@@ -119,7 +127,7 @@ class TravelPlannerAPITester:
         )
         return success
 
-    def test_create_trip(self):
+    async def test_create_trip(self):
         """Test trip creation"""
         # Calculate dates for the trip
         arrival_date = datetime.now() + timedelta(days=30)
@@ -141,7 +149,7 @@ class TravelPlannerAPITester:
             "places_preference": "balanced"
         }
         
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Create Trip",
             "POST",
             "trips",
@@ -154,9 +162,9 @@ class TravelPlannerAPITester:
             return True
         return False
 
-    def test_get_trips(self):
+    async def test_get_trips(self):
         """Test get user trips"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get User Trips",
             "GET",
             "trips",
@@ -167,13 +175,30 @@ class TravelPlannerAPITester:
             return True
         return False
 
-    def test_generate_itinerary(self):
+    async def test_get_trip(self):
+        """Test get single trip"""
+        if not self.trip_id:
+            print("❌ No trip ID available for getting trip")
+            return False
+            
+        success, response = await self.run_test(
+            "Get Trip",
+            "GET",
+            f"trips/{self.trip_id}",
+            200
+        )
+        if success and response.get('id') == self.trip_id:
+            print(f"   Retrieved trip: {response['location']}")
+            return True
+        return False
+
+    async def test_generate_itinerary(self):
         """Test itinerary generation"""
         if not self.trip_id:
             print("❌ No trip ID available for itinerary generation")
             return False
             
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Generate Itinerary",
             "POST",
             f"trips/{self.trip_id}/generate-itinerary",
@@ -184,13 +209,13 @@ class TravelPlannerAPITester:
             return True
         return False
 
-    def test_get_itinerary(self):
+    async def test_get_itinerary(self):
         """Test get itinerary"""
         if not self.trip_id:
             print("❌ No trip ID available for getting itinerary")
             return False
             
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Get Itinerary",
             "GET",
             f"trips/{self.trip_id}/itinerary",
@@ -201,9 +226,41 @@ class TravelPlannerAPITester:
             return True
         return False
 
-    def test_invalid_login(self):
+    async def check_not_modified(self, name, endpoint):
+        """Fetch an endpoint's ETag, then expect 304 when sending it back"""
+        response = await self.client.get(
+            f"{self.api_url}/{endpoint}",
+            headers={'Authorization': f'Bearer {self.token}'},
+            timeout=30
+        )
+        etag = response.headers.get('etag')
+        if not etag:
+            print(f"❌ {name} - No ETag on {endpoint} (status {response.status_code})")
+            return False
+        
+        success, _ = await self.run_test(
+            name,
+            "GET",
+            endpoint,
+            304,
+            headers={'If-None-Match': etag}
+        )
+        return success
+
+    async def test_trips_not_modified(self):
+        """Test conditional GET of the trip list"""
+        return await self.check_not_modified("Trips Not Modified", "trips")
+
+    async def test_itinerary_not_modified(self):
+        """Test conditional GET of the itinerary"""
+        if not self.trip_id:
+            print("❌ No trip ID available for conditional itinerary fetch")
+            return False
+        return await self.check_not_modified("Itinerary Not Modified", f"trips/{self.trip_id}/itinerary")
+
+    async def test_invalid_login(self):
         """Test login with invalid credentials"""
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Invalid Login",
             "POST",
             "auth/login",
@@ -215,51 +272,70 @@ class TravelPlannerAPITester:
         )
         return success
 
-    def test_unauthorized_access(self):
+    async def test_unauthorized_access(self):
         """Test accessing protected endpoint without token"""
-        # Temporarily remove token
-        original_token = self.token
-        self.token = None
-        
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Unauthorized Access",
             "GET",
             "trips",
-            401
+            401,
+            authenticated=False
         )
-        
-        # Restore token
-        self.token = original_token
         return success
 
-def main():
+    async def test_itinerary_flow(self):
+        """Generate an itinerary, then fetch it back (plain and conditional)"""
+        if not await self.test_generate_itinerary():
+            return False
+        if not await self.test_get_itinerary():
+            return False
+        return await self.test_itinerary_not_modified()
+
+async def run_named(test_name, test_func):
+    try:
+        if not await test_func():
+            return test_name
+    except Exception as e:
+        print(f"❌ {test_name} - Exception: {str(e)}")
+        return test_name
+    return None
+
+async def main():
     print("🚀 Starting Travel Planner API Tests")
     print("=" * 50)
     
     tester = TravelPlannerAPITester()
     
-    # Test sequence
-    tests = [
+    # Auth and trip creation must run in order; the rest only depend on them.
+    setup_tests = [
         ("User Registration", tester.test_user_registration),
         ("User Login", tester.test_user_login),
-        ("Get Current User", tester.test_get_current_user),
         ("Create Trip", tester.test_create_trip),
+        # Generating an itinerary updates the trip, changing the list's ETag,
+        # so this can't run alongside the itinerary flow below.
+        ("Trips Not Modified", tester.test_trips_not_modified),
+    ]
+    independent_tests = [
+        ("Get Current User", tester.test_get_current_user),
         ("Get User Trips", tester.test_get_trips),
-        ("Generate Itinerary", tester.test_generate_itinerary),
-        ("Get Itinerary", tester.test_get_itinerary),
+        ("Get Trip", tester.test_get_trip),
+        ("Generate and Get Itinerary", tester.test_itinerary_flow),
         ("Invalid Login", tester.test_invalid_login),
         ("Unauthorized Access", tester.test_unauthorized_access),
     ]
     
     failed_tests = []
     
-    for test_name, test_func in tests:
-        try:
-            if not test_func():
-                failed_tests.append(test_name)
-        except Exception as e:
-            print(f"❌ {test_name} - Exception: {str(e)}")
-            failed_tests.append(test_name)
+    http2 = importlib.util.find_spec("h2") is not None
+    async with httpx.AsyncClient(http2=http2, timeout=120) as client:
+        tester.client = client
+        for test_name, test_func in setup_tests:
+            failed = await run_named(test_name, test_func)
+            if failed:
+                failed_tests.append(failed)
+        
+        results = await asyncio.gather(*[run_named(name, func) for name, func in independent_tests])
+        failed_tests.extend(name for name in results if name)
     
     # Print results
     print("\n" + "=" * 50)
@@ -278,4 +354,4 @@ def main():
         return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""One-shot migration: convert ISO-string `created_at` values to BSON dates.
+
+Usage: python scripts/migrate_created_at.py
+Reads MONGO_URL and DB_NAME from backend/.env (or the environment).
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / 'backend' / '.env')
+
+COLLECTIONS = ["users", "trips", "itineraries"]
+
+
+def parse_created_at(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def migrate_collection(collection) -> int:
+    ops = []
+    async for doc in collection.find({'created_at': {'$type': 'string'}}, {'_id': 1, 'created_at': 1}):
+        ops.append(UpdateOne(
+            {'_id': doc['_id']},
+            {'$set': {'created_at': parse_created_at(doc['created_at'])}}
+        ))
+    if not ops:
+        return 0
+    result = await collection.bulk_write(ops, ordered=False)
+    return result.modified_count
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        for name in COLLECTIONS:
+            count = await migrate_collection(db[name])
+            print(f"{name}: converted {count} documents")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())